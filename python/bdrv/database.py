@@ -1,11 +1,77 @@
+import gzip
+import os
+import re
+import shutil
 import sqlite3
-from datetime import datetime
+import tempfile
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+# Имя файла помесячного раздела: measurements_ГГГГ_ММ.db (архив: *.db.gz)
+PARTITION_PATTERN = re.compile(r'^measurements_(\d{4}_\d{2})\.db$')
+ARCHIVE_PATTERN = re.compile(r'^measurements_(\d{4}_\d{2})\.db\.gz$')
+# SQLite по умолчанию позволяет подключить не более 10 баз
+MAX_ATTACHED = 8
+# Сколько распакованных архивных месяцев держать во временном каталоге
+MAX_UNPACKED = 12
+
+
+def _month_key(dt):
+    return f"{dt.year:04d}_{dt.month:02d}"
+
+
+def _shift_month(key, delta):
+    year, month = map(int, key.split('_'))
+    index = year * 12 + (month - 1) + delta
+    return f"{index // 12:04d}_{index % 12 + 1:02d}"
+
 
 class SensorDatabase:
-    def __init__(self, db_name='sensors.db'):
+    def __init__(self, db_name='sensors.db', partitioned=False,
+                 partition_dir=None, retention_months=None, archive_dir=None):
+        """
+        partitioned      - хранить измерения в помесячных файлах БД; при первом
+                           открытии старая таблица measurements переносится в разделы,
+                           после этого БД открывается только с partitioned=True
+        partition_dir    - каталог разделов (по умолчанию <db_name>_partitions)
+        retention_months - сколько полных месяцев хранить в разделах, более
+                           старые разделы сжимаются в архив (None - не архивировать);
+                           архив читают только запросы с hours, доходящим до него
+        archive_dir      - каталог архива (по умолчанию <partition_dir>/archive)
+        """
+        if retention_months is not None and int(retention_months) < 0:
+            raise ValueError(f"retention_months не может быть отрицательным: {retention_months}")
+
         self.conn = sqlite3.connect(db_name)
+        self.partitioned = partitioned
+        self.retention_months = retention_months
+
+        if not partitioned and self._get_state('state'):
+            # Новые записи в main.measurements не видны запросам по разделам
+            self.conn.close()
+            raise ValueError(f"БД {db_name} разбита на разделы, открывайте с partitioned=True")
+
+        if partitioned:
+            base = os.path.splitext(db_name)[0]
+            self.partition_dir = partition_dir or f"{base}_partitions"
+            self.archive_dir = archive_dir or os.path.join(self.partition_dir, 'archive')
+            os.makedirs(self.partition_dir, exist_ok=True)
+            os.makedirs(self.archive_dir, exist_ok=True)
+
+            # Подключённые разделы: ключ месяца -> псевдоним (порядок LRU)
+            self._attached = OrderedDict()
+            # Распакованные копии архивных разделов: ключ месяца -> путь (порядок LRU)
+            self._unpacked = OrderedDict()
+            self._tmp_dir = None
+            self._partitions = self._scan(self.partition_dir, PARTITION_PATTERN)
+            self._archives = self._scan(self.archive_dir, ARCHIVE_PATTERN)
+
         self.create_tables()
 
+        if partitioned:
+            self._migrate_legacy()
+            self.apply_retention()
+
 
     def create_tables(self):
         # Таблица с информацией о датчиках
@@ -29,10 +95,274 @@ class SensorDatabase:
         )
         """
         
+        # Состояние помесячного хранения: этап переноса старой таблицы и т.п.
+        partition_state_table_query = """
+        CREATE TABLE IF NOT EXISTS partition_state (
+            name TEXT PRIMARY KEY,
+            value
+        )
+        """
+        
         self.conn.execute(sensors_table_query)
-        self.conn.execute(measurements_table_query)
+        if self.partitioned:
+            self.conn.execute(partition_state_table_query)
+        else:
+            self.conn.execute(measurements_table_query)
+        self.conn.commit()
+
+    # ------------------------------------------------------------------
+    # Работа с помесячными разделами
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _utcnow():
+        # CURRENT_TIMESTAMP в SQLite хранится в UTC, разделы считаем так же
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def _get_state(self, name):
+        try:
+            cursor = self.conn.execute(
+                "SELECT value FROM main.partition_state WHERE name = ?", (name,)
+            )
+        except sqlite3.OperationalError:
+            # Таблицы нет - БД ни разу не открывалась с partitioned=True
+            return None
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, name, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO main.partition_state (name, value) VALUES (?, ?)",
+            (name, value)
+        )
+
+    @staticmethod
+    def _scan(directory, pattern):
+        found = {}
+        for name in os.listdir(directory):
+            match = pattern.match(name)
+            if match:
+                found[match.group(1)] = os.path.join(directory, name)
+        return found
+
+    def _partition_path(self, key):
+        return os.path.join(self.partition_dir, f"measurements_{key}.db")
+
+    def _attach(self, key, write=False):
+        """Подключение раздела за месяц key, возвращает псевдоним схемы"""
+        if write and key not in self._partitions and key in self._archives:
+            # Запись в распакованную временную копию была бы потеряна
+            self._restore(key)
+
+        if key in self._attached:
+            self._attached.move_to_end(key)
+            return self._attached[key]
+
+        if key in self._partitions:
+            path = self._partitions[key]
+        elif key in self._archives:
+            path = self._unpack(key)
+        else:
+            # Новый раздел создаётся только для записи текущего месяца
+            path = self._partition_path(key)
+            self._partitions[key] = path
+
+        while len(self._attached) >= MAX_ATTACHED:
+            old_key = next(iter(self._attached))
+            self._detach(old_key)
+
+        alias = f"p_{key}"
+        self.conn.commit()
+        self.conn.execute("ATTACH DATABASE ? AS " + alias, (path,))
+        self._attached[key] = alias
+        if key in self._unpacked:
+            # Архивные копии только читаются, схема в них уже есть
+            return alias
+
+        self.conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {alias}.measurements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sensor_id INTEGER NOT NULL,
+            temperature REAL,
+            co2_level INTEGER,
+            Vcc REAL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        self.conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {alias}.idx_measurements_timestamp "
+            f"ON measurements (timestamp)"
+        )
+        self.conn.commit()
+        return alias
+
+    def _last_issued_id(self):
+        """Наибольший id по всем разделам, включая архивные"""
+        last_id = 0
+        for key in set(self._partitions) | set(self._archives):
+            alias = self._attach(key)
+            cursor = self.conn.execute(
+                f"SELECT seq FROM {alias}.sqlite_sequence WHERE name = 'measurements'"
+            )
+            row = cursor.fetchone()
+            if row:
+                last_id = max(last_id, row[0])
+        return last_id
+
+    def _detach(self, key):
+        alias = self._attached.pop(key, None)
+        if alias:
+            self.conn.commit()
+            self.conn.execute("DETACH DATABASE " + alias)
+
+    def _drop_unpacked(self, key):
+        self._detach(key)
+        path = self._unpacked.pop(key, None)
+        if path:
+            os.remove(path)
+
+    def _unpack(self, key):
+        """Распаковка архивного раздела во временный файл для чтения"""
+        if key in self._unpacked:
+            self._unpacked.move_to_end(key)
+        else:
+            while len(self._unpacked) >= MAX_UNPACKED:
+                self._drop_unpacked(next(iter(self._unpacked)))
+            if self._tmp_dir is None:
+                self._tmp_dir = tempfile.mkdtemp(prefix='sensors_archive_')
+            path = os.path.join(self._tmp_dir, f"measurements_{key}.db")
+            with gzip.open(self._archives[key], 'rb') as src, open(path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            self._unpacked[key] = path
+        return self._unpacked[key]
+
+    def _restore(self, key):
+        """Возврат архивного раздела в каталог разделов для записи"""
+        self._drop_unpacked(key)
+        path = self._partition_path(key)
+        with gzip.open(self._archives[key], 'rb') as src, open(path + '.tmp', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(path + '.tmp', path)
+        os.remove(self._archives.pop(key))
+        self._partitions[key] = path
+
+    def _keys_since(self, start_key=None):
+        """
+        Ключи разделов от новых к старым. Без начала периода - только
+        рабочие разделы, архив читается, лишь когда период до него доходит.
+        """
+        if not start_key:
+            return sorted(self._partitions, reverse=True)
+        keys = set(self._partitions) | set(self._archives)
+        return sorted((key for key in keys if key >= start_key), reverse=True)
+
+    def _start_key(self, hours):
+        if not hours:
+            return None
+        return _month_key(self._utcnow() - timedelta(hours=float(hours)))
+
+    def _since(self, hours):
+        """Условие на начало периода: SQL-выражение и его параметр"""
+        if self.partitioned:
+            # Те же часы, по которым отбирались разделы
+            since = self._utcnow() - timedelta(hours=float(hours))
+            return "?", since.strftime('%Y-%m-%d %H:%M:%S')
+        return "datetime('now', ?)", f"-{hours} hours"
+
+    def _migrate_legacy(self):
+        """Перенос измерений из общей таблицы measurements в помесячные разделы"""
+        state = self._get_state('state')
+        cursor = self.conn.execute(
+            "SELECT name FROM main.sqlite_master WHERE type = 'table' AND name = 'measurements'"
+        )
+        has_legacy = cursor.fetchone() is not None
+
+        if state is None:
+            # Первый перенос id сохраняет; если разделы уже есть, их id
+            # могут совпасть со старыми, поэтому такие записи получают новые.
+            # last_id - общий для всех разделов счётчик id
+            fresh = not self._partitions and not self._archives
+            last_id = 0 if fresh else self._last_issued_id()
+            state = 'migrating' if has_legacy and fresh else 'partitioned'
+            self._set_state('state', state)
+            self._set_state('last_id', last_id)
+            self.conn.commit()
+
+        if not has_legacy:
+            return
+
+        keep_ids = state == 'migrating'
+        columns = "sensor_id, temperature, co2_level, Vcc, timestamp"
+
+        # Записи без времени попадают в раздел текущего месяца
+        current_key = _month_key(self._utcnow())
+        month_expr = "COALESCE(strftime('%Y_%m', timestamp), ?)"
+        cursor = self.conn.execute(
+            f"SELECT DISTINCT {month_expr} FROM main.measurements", (current_key,)
+        )
+        for (key,) in cursor.fetchall():
+            alias = self._attach(key, write=True)
+            last_id = self._get_state('last_id')
+            # Копирование и удаление в одной транзакции: после сбоя перенос
+            # продолжается с оставшихся записей. OR IGNORE - на случай, если
+            # прерванный первый перенос успел записать часть раздела
+            if keep_ids:
+                self.conn.execute(
+                    f"INSERT OR IGNORE INTO {alias}.measurements (id, {columns}) "
+                    f"SELECT id, {columns} FROM main.measurements WHERE {month_expr} = ?",
+                    (current_key, key)
+                )
+                cursor = self.conn.execute(
+                    f"SELECT MAX(id) FROM main.measurements WHERE {month_expr} = ?",
+                    (current_key, key)
+                )
+                last_id = max(last_id, cursor.fetchone()[0] or 0)
+            else:
+                cursor = self.conn.execute(
+                    f"INSERT INTO {alias}.measurements (id, {columns}) "
+                    f"SELECT ? + ROW_NUMBER() OVER (ORDER BY id), {columns} "
+                    f"FROM main.measurements WHERE {month_expr} = ?",
+                    (last_id, current_key, key)
+                )
+                last_id += cursor.rowcount
+            self._set_state('last_id', last_id)
+            self.conn.execute(
+                f"DELETE FROM main.measurements WHERE {month_expr} = ?", (current_key, key)
+            )
+            self.conn.commit()
+
+        self._set_state('state', 'partitioned')
+        self.conn.execute("DROP TABLE main.measurements")
         self.conn.commit()
 
+    def apply_retention(self):
+        """
+        Перенос разделов старше retention_months месяцев в сжатый архив.
+        Выполняется при открытии БД; долго работающему процессу вызывать
+        периодически (например, раз в сутки), вставка архивацию не запускает.
+        """
+        if not self.partitioned or self.retention_months is None:
+            return []
+
+        cutoff = _shift_month(_month_key(self._utcnow()), -int(self.retention_months))
+        archived = []
+        for key in sorted(self._partitions):
+            if key >= cutoff:
+                break
+            self._detach(key)
+            path = self._partitions.pop(key)
+            archive_path = os.path.join(self.archive_dir, os.path.basename(path) + '.gz')
+            # Через .tmp, чтобы после сбоя не остался обрезанный .gz
+            with open(path, 'rb') as src, gzip.open(archive_path + '.tmp', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(archive_path + '.tmp', archive_path)
+            os.remove(path)
+            self._archives[key] = archive_path
+            archived.append(key)
+        return archived
+
+    # ------------------------------------------------------------------
+
     def add_sensor(self, sensor_id, location):
         """Добавление нового датчика в систему"""
         try:
@@ -57,6 +387,21 @@ class SensorDatabase:
         if cursor.fetchone() is None:
             raise ValueError(f"Датчик с ID {sensor_id} не зарегистрирован")
         
+        if self.partitioned:
+            # Время задаём явно, чтобы запись попала в раздел своего месяца
+            now = self._utcnow()
+            alias = self._attach(_month_key(now), write=True)
+            # id берём из общего счётчика: разделы могут создаваться не по порядку
+            new_id = self._get_state('last_id') + 1
+            self.conn.execute(
+                f"INSERT INTO {alias}.measurements "
+                "(id, sensor_id, temperature, co2_level, Vcc, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                (new_id, sensor_id, temperature, co2_level, Vcc, now.strftime('%Y-%m-%d %H:%M:%S'))
+            )
+            self._set_state('last_id', new_id)
+            self.conn.commit()
+            return
+
         # Добавляем измерение
         self.conn.execute(
             "INSERT INTO measurements (sensor_id, temperature, co2_level, Vcc) VALUES (?, ?, ?, ?)",
@@ -69,12 +414,11 @@ class SensorDatabase:
         cursor = self.conn.execute("SELECT * FROM sensors")
         return cursor.fetchall()
 
-    def get_measurements(self, sensor_id=None, hours=None, limit=100):
-        """Получение измерений с возможностью фильтрации"""
-        query = """
+    def _measurements_query(self, table, sensor_id=None, hours=None):
+        query = f"""
         SELECT m.*, s.location 
-        FROM measurements m 
-        JOIN sensors s ON m.sensor_id = s.sensor_id
+        FROM {table} m
+        JOIN main.sensors s ON m.sensor_id = s.sensor_id
         """
         params = []
         
@@ -84,20 +428,42 @@ class SensorDatabase:
             params.append(sensor_id)
             
         if hours:
-            conditions.append(" m.timestamp > datetime('now', ?) ")
-            params.append(f"-{hours} hours")
+            since, param = self._since(hours)
+            conditions.append(f" m.timestamp > {since} ")
+            params.append(param)
             
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
             
         query += " ORDER BY m.timestamp DESC LIMIT ?"
-        params.append(limit)
+        return query, params
         
-        cursor = self.conn.execute(query, params)
-        return cursor.fetchall()
+    def get_measurements(self, sensor_id=None, hours=None, limit=100):
+        """Получение измерений с возможностью фильтрации"""
+        if not self.partitioned:
+            query, params = self._measurements_query('measurements', sensor_id, hours)
+            params.append(limit)
+            cursor = self.conn.execute(query, params)
+            return cursor.fetchall()
+
+        # Разделы не пересекаются по времени, поэтому идём от новых к старым
+        # и останавливаемся, как только набрали limit записей
+        rows = []
+        for key in self._keys_since(self._start_key(hours)):
+            if len(rows) >= limit:
+                break
+            alias = self._attach(key)
+            query, params = self._measurements_query(f"{alias}.measurements", sensor_id, hours)
+            params.append(limit - len(rows))
+            rows.extend(self.conn.execute(query, params).fetchall())
+        return rows
 
     def get_latest_measurement(self, sensor_id):
         """Получение последнего измерения для конкретного датчика"""
+        if self.partitioned:
+            rows = self.get_measurements(sensor_id=sensor_id, limit=1)
+            return rows[0] if rows else None
+
         query = """
         SELECT m.*, s.location 
         FROM measurements m 
@@ -111,29 +477,43 @@ class SensorDatabase:
 
     def get_average_readings(self, sensor_id=None, hours=24):
         """Получение средних показаний за указанный период"""
-        query = """
-        SELECT 
-            AVG(temperature) as avg_temp,
-            AVG(co2_level) as avg_co2
-        FROM measurements 
-        WHERE timestamp > datetime('now', ?)
-        """
-        params = [f"-{hours} hours"]
+        if self.partitioned:
+            # Пустой период (hours = None или 0) - как и без разделов, средних нет
+            keys = self._keys_since(self._start_key(hours)) if hours else []
+        else:
+            keys = [None]
         
-        if sensor_id:
-            query += " AND sensor_id = ?"
-            params.append(sensor_id)
+        # Для разделов складываем суммы и количества, среднее считаем в конце
+        since, param = self._since(hours) if keys else (None, None)
+        totals = [0, 0, 0, 0]
+        for key in keys:
+            table = f"{self._attach(key)}.measurements" if key else 'measurements'
+            query = f"""
+            SELECT
+                SUM(temperature), COUNT(temperature),
+                SUM(co2_level), COUNT(co2_level)
+            FROM {table}
+            WHERE timestamp > {since}
+            """
+            params = [param]
             
-        cursor = self.conn.execute(query, params)
-        result = cursor.fetchone()
+            if sensor_id:
+                query += " AND sensor_id = ?"
+                params.append(sensor_id)
+
+            cursor = self.conn.execute(query, params)
+            result = cursor.fetchone()
+            totals = [total + (value or 0) for total, value in zip(totals, result)]
         
         return {
-            'avg_temperature': round(result[0], 2) if result[0] is not None else None,
-            'avg_co2': round(result[1], 2) if result[1] is not None else None
+            'avg_temperature': round(totals[0] / totals[1], 2) if totals[1] else None,
+            'avg_co2': round(totals[2] / totals[3], 2) if totals[3] else None
         }
 
     def close(self):
         self.conn.close()
+        if self.partitioned and self._tmp_dir:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
 if __name__ == "__main__":
     db = SensorDatabase()
     
@@ -0,0 +1,302 @@
+import os
+from datetime import datetime
+
+import pytest
+
+import database
+from database import MAX_ATTACHED, MAX_UNPACKED, SensorDatabase, _month_key, _shift_month
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемые "текущие" дата и время для SensorDatabase"""
+    now = [datetime(2024, 1, 15, 12, 0, 0)]
+    monkeypatch.setattr(SensorDatabase, '_utcnow', staticmethod(lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def open_db(tmp_path):
+    opened = []
+
+    def _open(**kwargs):
+        db = SensorDatabase(str(tmp_path / 'sensors.db'), **kwargs)
+        opened.append(db)
+        return db
+
+    yield _open
+    for db in opened:
+        try:
+            db.close()
+        except Exception:
+            pass
+
+
+def fill_months(db, clock, months, sensor_id=1):
+    """По одному измерению в середине каждого месяца 2024 года"""
+    for month in months:
+        clock[0] = datetime(2024, month, 15, 12, 0, 0)
+        db.add_measurement(sensor_id, float(month), 400 + month, 3.3)
+
+
+def test_month_keys_across_year_boundary():
+    assert _month_key(datetime(2024, 3, 1)) == '2024_03'
+    assert _shift_month('2024_01', -1) == '2023_12'
+    assert _shift_month('2023_12', 1) == '2024_01'
+    assert _shift_month('2024_03', -15) == '2022_12'
+    assert _shift_month('2024_03', 0) == '2024_03'
+
+
+def test_unpartitioned_mode_unchanged(open_db, tmp_path):
+    db = open_db()
+    db.add_sensor(1, 'Кухня')
+    db.add_measurement(1, 21.5, 450, 3.3)
+
+    assert len(db.get_measurements()) == 1
+    assert db.get_latest_measurement(1)[2] == 21.5
+    assert db.get_average_readings(1) == {'avg_temperature': 21.5, 'avg_co2': 450}
+    assert not os.path.exists(tmp_path / 'sensors_partitions')
+
+
+def test_rollover_with_retention_archives_old_months(open_db, clock):
+    db = open_db(partitioned=True)
+    db.add_sensor(1, 'Кухня')
+    fill_months(db, clock, range(1, 7))
+    db.close()
+
+    db = open_db(partitioned=True, retention_months=2)
+    assert sorted(db._partitions) == ['2024_04', '2024_05', '2024_06']
+    assert sorted(db._archives) == ['2024_01', '2024_02', '2024_03']
+    archive_files = os.listdir(db.archive_dir)
+    assert sorted(archive_files) == [f'measurements_2024_0{m}.db.gz' for m in (1, 2, 3)]
+
+    # Без периода читаются только рабочие разделы
+    assert [row[2] for row in db.get_measurements()] == [6.0, 5.0, 4.0]
+
+    rows = db.get_measurements(hours=24 * 366)
+    assert [row[2] for row in rows] == [6.0, 5.0, 4.0, 3.0, 2.0, 1.0]
+    # id продолжают нумерацию между разделами
+    assert [row[0] for row in rows] == [6, 5, 4, 3, 2, 1]
+
+
+def test_insert_does_not_archive(open_db, clock):
+    db = open_db(partitioned=True, retention_months=0)
+    db.add_sensor(1, 'Кухня')
+    fill_months(db, clock, range(1, 4))
+
+    assert db._archives == {}
+    assert db.apply_retention() == ['2024_01', '2024_02']
+    assert sorted(db._partitions) == ['2024_03']
+    assert not [name for name in os.listdir(db.archive_dir) if name.endswith('.tmp')]
+
+
+def test_reads_through_archived_months(open_db, clock):
+    db = open_db(partitioned=True)
+    db.add_sensor(1, 'Кухня')
+    db.add_sensor(2, 'Спальня')
+    fill_months(db, clock, range(1, 7))
+    fill_months(db, clock, [1], sensor_id=2)
+    db.close()
+
+    clock[0] = datetime(2024, 6, 20)
+
+    db = open_db(partitioned=True, retention_months=1)
+    assert '2024_01' in db._archives
+
+    assert db.get_latest_measurement(2) is None
+    rows = db.get_measurements(sensor_id=2, hours=24 * 366)
+    assert len(rows) == 1
+    assert rows[0][1] == 2 and rows[0][2] == 1.0 and rows[0][-1] == 'Спальня'
+
+    averages = db.get_average_readings(1, hours=24 * 366)
+    assert averages == {'avg_temperature': 3.5, 'avg_co2': 403.5}
+
+    tmp_dir = db._tmp_dir
+    db.close()
+    assert not os.path.exists(tmp_dir)
+
+
+def test_eviction_past_max_attached(open_db, clock):
+    db = open_db(partitioned=True)
+    db.add_sensor(1, 'Кухня')
+    fill_months(db, clock, range(1, 13))
+    assert len(db._attached) <= MAX_ATTACHED
+    db.close()
+
+    db = open_db(partitioned=True, retention_months=0)
+    assert len(db._archives) == 11
+
+    rows = db.get_measurements(hours=24 * 366)
+    assert [row[2] for row in rows] == [float(m) for m in range(12, 0, -1)]
+    assert len(db._attached) <= MAX_ATTACHED
+    assert len(db._unpacked) <= MAX_UNPACKED
+    assert len(os.listdir(db._tmp_dir)) == len(db._unpacked)
+
+    assert db.get_average_readings(hours=24 * 366)['avg_temperature'] == 6.5
+
+
+def test_queries_prune_partitions_and_stop_on_limit(open_db, clock):
+    db = open_db(partitioned=True)
+    db.add_sensor(1, 'Кухня')
+    fill_months(db, clock, range(1, 7))
+    db.close()
+
+    clock[0] = datetime(2024, 6, 20)
+    db = open_db(partitioned=True)
+    rows = db.get_measurements(hours=24 * 30)
+    assert [row[2] for row in rows] == [6.0]
+    assert sorted(db._attached) == ['2024_05', '2024_06']
+    db.close()
+
+    db = open_db(partitioned=True)
+    assert db.get_measurements(limit=1)[0][2] == 6.0
+    assert list(db._attached) == ['2024_06']
+
+    assert [row[2] for row in db.get_measurements(limit=3)] == [6.0, 5.0, 4.0]
+
+
+def test_negative_retention_rejected(open_db):
+    with pytest.raises(ValueError):
+        open_db(partitioned=True, retention_months=-1)
+
+
+def test_write_to_archived_month_restores_partition(open_db, clock):
+    db = open_db(partitioned=True)
+    db.add_sensor(1, 'Кухня')
+    fill_months(db, clock, [1])
+    db.close()
+
+    clock[0] = datetime(2024, 2, 1)
+    db = open_db(partitioned=True, retention_months=0)
+    assert '2024_01' in db._archives
+
+    # Часы отстают: запись снова приходится на архивный месяц
+    clock[0] = datetime(2024, 1, 31, 23, 0, 0)
+    db.add_measurement(1, 20.0, 500, 3.3)
+    assert '2024_01' in db._partitions and '2024_01' not in db._archives
+    db.close()
+
+    db = open_db(partitioned=True)
+    assert [row[2] for row in db.get_measurements()] == [20.0, 1.0]
+
+
+def test_legacy_measurements_migrated(open_db, clock):
+    db = open_db()
+    db.add_sensor(1, 'Кухня')
+    db.conn.executemany(
+        "INSERT INTO measurements (sensor_id, temperature, co2_level, Vcc, timestamp) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(1, 10.0, 400, 3.3, '2023-12-31 23:00:00'),
+         (1, 11.0, 410, 3.3, '2024-01-10 08:00:00')]
+    )
+    db.conn.commit()
+    assert len(db.get_measurements()) == 2
+    db.close()
+
+    db = open_db(partitioned=True)
+    assert sorted(db._partitions) == ['2023_12', '2024_01']
+    assert [row[2] for row in db.get_measurements()] == [11.0, 10.0]
+
+    db.add_measurement(1, 12.0, 420, 3.3)
+    assert [row[0] for row in db.get_measurements()] == [3, 2, 1]
+    db.close()
+
+    # Повторное открытие не дублирует перенесённые записи
+    db = open_db(partitioned=True)
+    assert len(db.get_measurements()) == 3
+
+
+def test_unpartitioned_open_of_partitioned_db_rejected(open_db, clock):
+    db = open_db(partitioned=True)
+    db.add_sensor(1, 'Кухня')
+    db.add_measurement(1, 1.0, 400, 3.3)
+    db.close()
+
+    with pytest.raises(ValueError):
+        open_db()
+
+
+def test_rows_added_after_partitioning_get_new_ids(open_db, clock):
+    db = open_db(partitioned=True)
+    db.add_sensor(1, 'Кухня')
+    fill_months(db, clock, [1, 1])
+    # Таблица, созданная в обход partitioned=True, с id, совпадающими с разделом
+    db.conn.execute(
+        "CREATE TABLE measurements (id INTEGER PRIMARY KEY AUTOINCREMENT, sensor_id INTEGER, "
+        "temperature REAL, co2_level INTEGER, Vcc REAL, timestamp DATETIME)"
+    )
+    db.conn.execute(
+        "INSERT INTO measurements (sensor_id, temperature, co2_level, Vcc, timestamp) "
+        "VALUES (1, 99.0, 400, 3.3, '2024-01-20 10:00:00')"
+    )
+    db.conn.commit()
+    db.close()
+
+    db = open_db(partitioned=True)
+    rows = db.get_measurements()
+    assert sorted(row[2] for row in rows) == [1.0, 1.0, 99.0]
+    assert len({row[0] for row in rows}) == 3
+
+
+def test_archives_unpacked_only_when_period_reaches_them(open_db, clock, monkeypatch):
+    db = open_db(partitioned=True)
+    db.add_sensor(1, 'Кухня')
+    db.add_sensor(2, 'Спальня')
+    fill_months(db, clock, [1], sensor_id=2)
+    fill_months(db, clock, range(1, 13))
+    db.close()
+
+    clock[0] = datetime(2025, 1, 15)
+    db = open_db(partitioned=True, retention_months=0)
+    assert len(db._archives) == 12
+
+    unpacks = []
+    gzip_open = database.gzip.open
+
+    def counting_open(path, mode='rb', *args, **kwargs):
+        if 'r' in mode:
+            unpacks.append(path)
+        return gzip_open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr(database.gzip, 'open', counting_open)
+
+    for _ in range(3):
+        assert db.get_latest_measurement(2) is None
+    assert unpacks == []
+
+    # Период в год доходит до архива: каждый месяц распаковывается один раз
+    for _ in range(3):
+        assert db.get_average_readings(1, hours=24 * 400)['avg_temperature'] == 6.5
+    assert len(unpacks) == 12
+
+
+@pytest.mark.parametrize('partitioned', [False, True])
+def test_average_readings_for_empty_period(open_db, clock, monkeypatch, partitioned):
+    db = open_db(partitioned=partitioned)
+    db.add_sensor(1, 'Кухня')
+    db.add_measurement(1, 21.5, 450, 3.3)
+    if partitioned:
+        # Ни один раздел не должен подключаться
+        monkeypatch.setattr(db, '_attach', None)
+
+    empty = {'avg_temperature': None, 'avg_co2': None}
+    assert db.get_average_readings(hours=None) == empty
+    assert db.get_average_readings(hours=0) == empty
+
+
+def test_write_to_earlier_missing_month_keeps_ids_unique(open_db, clock):
+    db = open_db(partitioned=True)
+    db.add_sensor(1, 'Кухня')
+    fill_months(db, clock, [1, 2])
+    db.close()
+
+    db = open_db(partitioned=True)
+    # Часы ушли назад в месяц, для которого раздела ещё нет
+    clock[0] = datetime(2023, 11, 20)
+    db.add_measurement(1, 30.0, 500, 3.3)
+    assert '2023_11' in db._partitions
+
+    clock[0] = datetime(2024, 2, 20)
+    rows = db.get_measurements(hours=24 * 365)
+    assert sorted(row[0] for row in rows) == [1, 2, 3]
+    assert [row[0] for row in rows if row[2] == 30.0] == [3]